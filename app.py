@@ -1,9 +1,17 @@
+import copy
 import os
+import queue
+import threading
+import time
 import pyodbc
 import json
+from cachetools import LRUCache, TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from dotenv import load_dotenv
 from azure.identity import DefaultAzureCredential
-from payslip_fill import fetch_paystub_rows, render_payslip_docx, upload_bytes_to_blob
+from payslip_fill import fetch_paystub_rows, render_payslip_docx, upload_bytes_to_blob, get_blob_client
 from pdf_fill import (
     download_blob_bytes, 
     list_pdf_fields, 
@@ -13,7 +21,7 @@ from pdf_fill import (
     create_t4_field_map,
     create_t4a_field_map
 )
-from prompts import classify_request, validate_parameters, search_employees_by_name, confirm_employee_selection
+from prompts import classify_request, validate_parameters, search_employees_by_name, confirm_employee_selection, discard_search_cursor
 
 # Load environment variables
 load_dotenv()
@@ -26,97 +34,187 @@ session_token_tracker = {
     "request_count": 0
 }
 
+# AAD tokens are valid for ~1 hour; cache one so repeated connection
+# attempts don't each pay the credential round-trip
+_token_cache = {"token": None, "exp": 0}
+_token_lock = threading.Lock()
+
+
+def _get_sql_access_token():
+    """Get an AAD access token for Azure SQL, reusing a cached one if still valid"""
+    from azure.identity import AzureCliCredential
+
+    with _token_lock:
+        # Refresh 5 minutes before actual expiry to avoid edge-of-window failures
+        if _token_cache["token"] and time.time() < _token_cache["exp"] - 300:
+            return _token_cache["token"]
+
+        credential = AzureCliCredential()
+        token = credential.get_token("https://database.windows.net/")
+        _token_cache["token"] = token.token
+        _token_cache["exp"] = token.expires_on
+        return token.token
+
+
+@lru_cache(maxsize=1)
+def _sql_conn_info():
+    """Parse SQL_CONNECTION_STRING once and precompute the per-auth connect strings"""
+    base_conn = os.environ["SQL_CONNECTION_STRING"].strip('"')
+    parts = dict(p.split("=", 1) for p in base_conn.split(";") if "=" in p)
+
+    common = (
+        "Driver={ODBC Driver 18 for SQL Server};"
+        f"Server={parts['Server']};"
+        f"Database={parts['Database']};"
+        "Encrypt=yes;"
+        "TrustServerCertificate=no;"
+        "Connection Timeout=30;"
+    )
+    return {
+        "base": base_conn,
+        "interactive": common + "Authentication=ActiveDirectoryInteractive;",
+        # Token auth passes the access token out of band - no Authentication parameter
+        "token": common,
+        "device": common + "Authentication=ActiveDirectoryDeviceCodeFlow;",
+    }
+
+
 def get_db_connection():
     """Create database connection using Azure Identity"""
+    conn_info = _sql_conn_info()
     try:
         # Try Azure AD Interactive authentication (should work with Microsoft accounts)
-        # Extract server and database from environment connection string
-        base_conn = os.environ["SQL_CONNECTION_STRING"].strip('"')
-        
-        # Extract server and database properly
-        server_part = [part for part in base_conn.split(";") if part.startswith("Server=")][0]
-        server = server_part.split("=", 1)[1]
-        
-        database_part = [part for part in base_conn.split(";") if part.startswith("Database=")][0]
-        database = database_part.split("=", 1)[1]
-        
-        conn_str = (
-            "Driver={ODBC Driver 18 for SQL Server};"
-            f"Server={server};"
-            f"Database={database};"
-            "Authentication=ActiveDirectoryInteractive;"
-            "Encrypt=yes;"
-            "TrustServerCertificate=no;"
-            "Connection Timeout=30;"
-        )
         print("Attempting Azure AD Interactive authentication (may open browser)...")
-        return pyodbc.connect(conn_str)
-        
+        return pyodbc.connect(conn_info["interactive"])
+
     except Exception as e:
         print(f"Azure AD Interactive failed ({e})")
-        
+
         try:
             # Try Azure CLI credential with proper token handling
-            from azure.identity import AzureCliCredential
-            credential = AzureCliCredential()
-            token = credential.get_token("https://database.windows.net/")
-            
-            # Build connection string without Authentication parameter
-            base_conn = os.environ["SQL_CONNECTION_STRING"].strip('"')
-            
-            # Extract server and database properly
-            server_part = [part for part in base_conn.split(";") if part.startswith("Server=")][0]
-            server = server_part.split("=", 1)[1]
-            
-            database_part = [part for part in base_conn.split(";") if part.startswith("Database=")][0]
-            database = database_part.split("=", 1)[1]
-            
-            conn_str = (
-                "Driver={ODBC Driver 18 for SQL Server};"
-                f"Server={server};"
-                f"Database={database};"
-                "Encrypt=yes;"
-                "TrustServerCertificate=no;"
-                "Connection Timeout=30;"
-            )
-            
-            # Use the token directly
-            conn = pyodbc.connect(conn_str, attrs_before={
-                1256: token.token.encode('utf-16-le')  # SQL_COPT_SS_ACCESS_TOKEN
+            access_token = _get_sql_access_token()
+            conn = pyodbc.connect(conn_info["token"], attrs_before={
+                1256: access_token.encode('utf-16-le')  # SQL_COPT_SS_ACCESS_TOKEN
             })
             print("Azure CLI credential authentication successful")
             return conn
-            
+
         except Exception as e2:
             print(f"Azure CLI authentication failed ({e2})")
-            
+
             try:
                 # Try Azure AD Device Code authentication
-                base_conn = os.environ["SQL_CONNECTION_STRING"].strip('"')
-                
-                # Extract server and database properly
-                server_part = [part for part in base_conn.split(";") if part.startswith("Server=")][0]
-                server = server_part.split("=", 1)[1]
-                
-                database_part = [part for part in base_conn.split(";") if part.startswith("Database=")][0]
-                database = database_part.split("=", 1)[1]
-                
-                conn_str = (
-                    "Driver={ODBC Driver 18 for SQL Server};"
-                    f"Server={server};"
-                    f"Database={database};"
-                    "Authentication=ActiveDirectoryDeviceCodeFlow;"
-                    "Encrypt=yes;"
-                    "TrustServerCertificate=no;"
-                    "Connection Timeout=30;"
-                )
                 print("Attempting Azure AD Device Code authentication...")
-                return pyodbc.connect(conn_str)
-                
+                return pyodbc.connect(conn_info["device"])
+
             except Exception as e3:
-                # Last fallback to SQL authentication 
+                # Last fallback to SQL authentication
                 print(f"All Azure AD methods failed ({e3}), trying SQL authentication...")
-                return pyodbc.connect(os.environ["SQL_CONNECTION_STRING"])
+                return pyodbc.connect(conn_info["base"])
+
+class _ConnectionPool:
+    """Reuse authenticated ODBC connections across requests.
+
+    Opening a connection triggers an Azure AD auth flow (potentially an
+    interactive browser round-trip), so paying that cost once per session
+    instead of once per query dominates everything else latency-wise.
+    """
+
+    def __init__(self, maxsize=4):
+        self._pool = queue.LifoQueue(maxsize=maxsize)
+
+    @staticmethod
+    def _discard(cnxn):
+        """Close a connection for good, evicting its cached search cursor"""
+        discard_search_cursor(cnxn)
+        try:
+            cnxn.close()
+        except pyodbc.Error:
+            pass
+
+    @contextmanager
+    def acquire(self):
+        try:
+            cnxn = self._pool.get_nowait()
+        except queue.Empty:
+            cnxn = get_db_connection()
+        else:
+            # Validate the idle connection; discard and reconnect if stale
+            try:
+                cnxn.execute("SELECT 1").fetchone()
+            except pyodbc.OperationalError:
+                self._discard(cnxn)
+                cnxn = get_db_connection()
+        try:
+            yield cnxn
+        finally:
+            # Always hand the connection back, even when the body raised
+            # (including KeyboardInterrupt at an input() prompt) - dropping
+            # it silently would re-pay the AAD auth flow on the next
+            # request. Connections are non-autocommit, so roll back first
+            # rather than passing an open transaction to the next user;
+            # a failed rollback means the connection is broken, so discard.
+            try:
+                cnxn.rollback()
+                self._pool.put_nowait(cnxn)
+            except (queue.Full, pyodbc.Error):
+                self._discard(cnxn)
+
+
+POOL = _ConnectionPool()
+
+# Background workers so document rendering and blob client setup can
+# overlap instead of running back to back
+_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+
+# Classification results keyed by (normalized query, employee number) so
+# repeated queries like "my payslip last month" skip the LLM round-trip;
+# LRU-bounded so a long session can't grow it without limit
+_classification_cache = LRUCache(maxsize=512)
+
+# Recent name-search results; retries of the same name within a session
+# are common and shouldn't hit SQL again. TTLCache evicts expired
+# entries instead of merely bypassing them on read
+_NAME_SEARCH_TTL = 300  # seconds
+_name_search_cache = TTLCache(maxsize=512, ttl=_NAME_SEARCH_TTL)
+
+
+def search_employees_cached(employee_name, cnxn=None):
+    """Search employees by name, reusing results fetched in the last 5 minutes
+
+    Pass an already-checked-out connection to avoid a second pool checkout
+    when the caller holds one for the rest of the request.
+    """
+    key = employee_name.lower().strip()
+    matches = _name_search_cache.get(key)
+    if matches is not None:
+        return matches
+
+    if cnxn is not None:
+        matches = search_employees_by_name(cnxn, employee_name)
+    else:
+        with POOL.acquire() as pooled:
+            matches = search_employees_by_name(pooled, employee_name)
+    _name_search_cache[key] = matches
+    return matches
+
+
+def classify_request_cached(user_query, current_user_employee_number):
+    """Classify a request, reusing a cached result for repeated queries"""
+    key = (" ".join(user_query.lower().split()), current_user_employee_number)
+    cached = _classification_cache.get(key)
+    if cached is not None:
+        result = copy.deepcopy(cached)
+        # A cache hit costs no LLM tokens; keep the session tracker honest
+        result["token_info"] = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+        return result
+
+    result = classify_request(user_query, current_user_employee_number=current_user_employee_number)
+    if result.get("intent") != "ERROR":
+        # Deep-copy so callers mutating parameters don't poison the cache
+        _classification_cache[key] = copy.deepcopy(result)
+    return result
+
 
 def interactive_hr_system():
     """Interactive HR document generation - exactly what you asked for"""
@@ -146,14 +244,20 @@ def interactive_hr_system():
             
         if not user_query:
             continue
-            
+
+        if user_query.lower() == 'refresh':
+            _name_search_cache.clear()
+            print("Cleared cached employee search results")
+            continue
+
+
         print(f"\nProcessing: '{user_query}'")
         print("-" * 50)
         
         try:
             # Step 2: Convert to SQL query parameters
             print("Step 1: Converting natural language to SQL parameters...")
-            classification = classify_request(user_query, current_user_employee_number="102938")
+            classification = classify_request_cached(user_query, current_user_employee_number="102938")
             
             # Track tokens
             if 'token_info' in classification:
@@ -175,60 +279,64 @@ def interactive_hr_system():
             
             if 'PAYSLIP' in classification['intent']:
                 params = classification['parameters']
-                
-                # Handle name-based searches
-                if 'BY_NAME' in classification['intent']:
-                    employee_name = params['employeeName']
-                    print(f"   Searching for employee: '{employee_name}'")
-                    
-                    # Get database connection for employee search
-                    cnxn = get_db_connection()
-                    matches = search_employees_by_name(cnxn, employee_name)
-                    
-                    if not matches:
-                        print(f"No employees found matching '{employee_name}'")
-                        cnxn.close()
-                        continue
-                    
-                    # Get employee confirmation
-                    employee_number = confirm_employee_selection(matches, employee_name)
-                    if not employee_number:
-                        print("Operation cancelled")
-                        cnxn.close()
-                        continue
-                    
-                    # Update parameters with confirmed employee number
-                    params['employeeNumber'] = employee_number
-                    cnxn.close()
-                
-                employee_number = params['employeeNumber']
-                from_date = params['fromDate']
-                to_date = params['toDate']
-                
-                print(f"   SQL: EXEC sp_GetPaystubForRange @EmployeeNumber='{employee_number}', @From='{from_date}', @To='{to_date}'")
-                
-                cnxn = get_db_connection()
-                rows = fetch_paystub_rows(cnxn, employee_number, from_date, to_date)
-                cnxn.close()
-                
+
+                # One pooled connection spans the name search and the
+                # paystub fetch, so the common "look up by name then fetch"
+                # flow costs no extra checkouts
+                with POOL.acquire() as cnxn:
+                    # Handle name-based searches
+                    if 'BY_NAME' in classification['intent']:
+                        employee_name = params['employeeName']
+                        print(f"   Searching for employee: '{employee_name}'")
+
+                        matches = search_employees_cached(employee_name, cnxn)
+
+                        if not matches:
+                            print(f"No employees found matching '{employee_name}'")
+                            continue
+
+                        # Get employee confirmation
+                        employee_number = confirm_employee_selection(matches, employee_name)
+                        if not employee_number:
+                            print("Operation cancelled")
+                            continue
+
+                        # Update parameters with confirmed employee number
+                        params['employeeNumber'] = employee_number
+
+                    employee_number = params['employeeNumber']
+                    from_date = params['fromDate']
+                    to_date = params['toDate']
+
+                    print(f"   SQL: EXEC sp_GetPaystubForRange @EmployeeNumber='{employee_number}', @From='{from_date}', @To='{to_date}'")
+
+                    # fetch_paystub_rows streams; materialize while the
+                    # connection is still checked out
+                    rows = list(fetch_paystub_rows(cnxn, employee_number, from_date, to_date))
+
+
                 if not rows:
                     print(f"No data found for employee {employee_number} in date range")
                     continue
                     
-                print(f"Found {len(rows)} pay periods for {rows[0]['FullName']}")
+                print(f"Found {len(rows)} pay periods for {rows[0].FullName}")
                 
                 # Step 4: Map to payslip_template.docx
                 print("\nStep 3: Mapping data to payslip_template.docx...")
+                # Warm up the blob client (credential chain + TLS) while the
+                # document renders - the two don't depend on each other
+                blob_warmup = _EXECUTOR.submit(get_blob_client)
                 doc_buffer = render_payslip_docx(rows)
-                doc_bytes = doc_buffer.getvalue()
-                print(f"   Document generated: {len(doc_bytes):,} bytes")
+                blob_warmup.result()
+                print(f"   Document generated: {doc_buffer.getbuffer().nbytes:,} bytes")
                 
                 # Step 5: Store in output container
                 print("\nStep 4: Storing in output container...")
-                employee_name = rows[0]['FullName'].replace(' ', '_')
+                employee_name = rows[0].FullName.replace(' ', '_')
                 filename = f"paystub_{employee_name}_{from_date.replace('-', '')}_to_{to_date.replace('-', '')}.docx"
                 
-                upload_bytes_to_blob("output", filename, doc_bytes)
+                doc_buffer.seek(0)
+                upload_bytes_to_blob("output", filename, doc_buffer)
                 
                 # Show result
                 blob_cs = os.environ["BLOB_CONNECTION_STRING"].strip('"')
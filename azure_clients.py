@@ -0,0 +1,37 @@
+"""Shared, cached Azure SDK clients for the document modules
+
+Building a DefaultAzureCredential walks the whole credential chain
+(~100ms) and a fresh BlobServiceClient redoes TLS and auth discovery, so
+both are constructed once per process and reused. The credential object
+caches its tokens internally, and the blob client's connection pool
+amortizes TLS setup across uploads.
+"""
+import os
+from functools import lru_cache
+
+from azure.storage.blob import BlobServiceClient
+from azure.identity import DefaultAzureCredential
+
+
+@lru_cache(maxsize=1)
+def get_credential():
+    """Build the shared DefaultAzureCredential (interactive browser excluded)"""
+    return DefaultAzureCredential(
+        exclude_interactive_browser_credential=True,
+        exclude_shared_token_cache_credential=False,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_blob_client():
+    """Get the shared blob service client with Azure Identity or connection string fallback"""
+    try:
+        # Try Azure Identity first (recommended for production)
+        credential = get_credential()
+        blob_cs = os.environ["BLOB_CONNECTION_STRING"]
+        account_name = blob_cs.split("AccountName=")[1].split(";")[0]
+        storage_url = f"https://{account_name}.blob.core.windows.net"
+        return BlobServiceClient(account_url=storage_url, credential=credential)
+    except Exception:
+        # Fallback to connection string
+        return BlobServiceClient.from_connection_string(os.environ["BLOB_CONNECTION_STRING"])
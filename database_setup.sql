@@ -28,6 +28,10 @@ CREATE TABLE dbo.Employees (
 );
 GO
 
+-- Serves prefix name searches (LIKE 'name%') with an index seek
+CREATE INDEX IX_Employees_FullName ON dbo.Employees(FullName);
+GO
+
 -- Payroll periods and calculations
 CREATE TABLE dbo.Payruns (
     PayrunId INT IDENTITY PRIMARY KEY,
@@ -3,6 +3,7 @@ Simple test script to inspect PDF form fields
 Run this first to understand what fields are available in your T4/T4A templates
 """
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from azure.storage.blob import BlobServiceClient
 from azure.identity import DefaultAzureCredential
@@ -41,25 +42,31 @@ def inspect_pdf_templates():
     
     templates_container = os.environ.get("BLOB_CONTAINER_TEMPLATES", "templates")
     pdf_files = ["t4-fill-24e.pdf", "t4a-fill-24e.pdf"]
-    
-    for pdf_file in pdf_files:
+
+    def inspect_one(pdf_file):
+        # Download the PDF and list its form fields
+        blob_data = blob_client.get_blob_client(container=templates_container, blob=pdf_file).download_blob()
+        pdf_bytes = blob_data.readall()
+        return len(pdf_bytes), list_pdf_fields(pdf_bytes)
+
+    # The templates are independent; download/parse them concurrently so one
+    # file's blob download overlaps with the other's parsing
+    with ThreadPoolExecutor(max_workers=len(pdf_files)) as pool:
+        futures = {pdf_file: pool.submit(inspect_one, pdf_file) for pdf_file in pdf_files}
+
+    for pdf_file, future in futures.items():
         print(f"\n=== Inspecting {pdf_file} ===")
         try:
-            # Download the PDF
-            blob_data = blob_client.get_blob_client(container=templates_container, blob=pdf_file).download_blob()
-            pdf_bytes = blob_data.readall()
-            print(f"Downloaded {pdf_file} ({len(pdf_bytes)} bytes)")
-            
-            # List form fields
-            fields = list_pdf_fields(pdf_bytes)
-            
+            size, fields = future.result()
+            print(f"Downloaded {pdf_file} ({size} bytes)")
+
             if fields:
                 print(f"📋 Found {len(fields)} form fields:")
                 for i, field in enumerate(fields, 1):
                     print(f"  {i:2d}. {field}")
             else:
                 print("Warning: No form fields found - PDF might not be a fillable form")
-                
+
         except Exception as e:
             print(f"Error inspecting {pdf_file}: {e}")
 
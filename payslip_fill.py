@@ -1,49 +1,159 @@
 import io
 import os
+from collections import namedtuple
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+import numpy as np
 import pyodbc
 from docx import Document
-from azure.storage.blob import BlobServiceClient
-from azure.identity import DefaultAzureCredential
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from docxtpl import DocxTemplate
 
+from azure_clients import get_blob_client
 
-def get_blob_client():
-    """Get blob service client with Azure Identity or connection string fallback"""
-    try:
-        # Try Azure Identity first (recommended for production)
-        credential = DefaultAzureCredential()
-        blob_cs = os.environ["BLOB_CONNECTION_STRING"]
-        account_name = blob_cs.split("AccountName=")[1].split(";")[0]
-        storage_url = f"https://{account_name}.blob.core.windows.net"
-        return BlobServiceClient(account_url=storage_url, credential=credential)
-    except Exception:
-        # Fallback to connection string
-        return BlobServiceClient.from_connection_string(os.environ["BLOB_CONNECTION_STRING"])
+# Pre-built Jinja template for the payslip; when present it replaces the
+# from-scratch Document() construction below
+_TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "payslip_template.docx")
 
 
 def fetch_paystub_rows(cnxn, employee_number, date_from, date_to):
-    """Fetch paystub data using the stored procedure"""
+    """Stream paystub rows from the stored procedure in fixed-size batches
+
+    Yields one dict per row instead of materializing the whole result set
+    with fetchall(), so peak memory stays bounded for large date ranges.
+    """
     with cnxn.cursor() as cur:
+        cur.arraysize = 500
         cur.execute("""
             EXEC dbo.sp_GetPaystubForRange @EmployeeNumber=?, @From=?, @To=?
         """, (employee_number, date_from, date_to))
         cols = [c[0] for c in cur.description]
-        return [dict(zip(cols, r)) for r in cur.fetchall()]
+        # One namedtuple type per query; attribute access on it is C-level,
+        # unlike building a dict (and hashing its keys) for every row
+        Row = namedtuple('Row', cols, rename=True)
+        while True:
+            batch = cur.fetchmany(500)
+            if not batch:
+                break
+            yield from (Row(*r) for r in batch)
+
+
+# Below this many rows NumPy's fixed setup cost outweighs its C-loop sums
+_NUMPY_MIN_ROWS = 500
+
+
+def _aggregate_rows(rows):
+    """Build the formatted earnings rows and the four totals in one pass
+
+    Returns (earnings_rows, gross_total, cpp_total, ei_total, net_total).
+    Large date ranges take a NumPy path so the summation runs as C loops;
+    small ones stay on plain Python to skip NumPy's fixed overhead.
+    """
+    n = len(rows)
+    if n >= _NUMPY_MIN_ROWS:
+        gross = np.fromiter((float(r.GrossAmount) for r in rows), dtype=np.float64, count=n)
+        cpp = np.fromiter((float(r.CPP or 0) for r in rows), dtype=np.float64, count=n)
+        ei = np.fromiter((float(r.EI or 0) for r in rows), dtype=np.float64, count=n)
+        net = np.fromiter((float(r.NetAmount) for r in rows), dtype=np.float64, count=n)
+        earnings_rows = [
+            (f"Gross {r.PeriodStart}–{r.PeriodEnd}", f"{g:.2f}", "")
+            for r, g in zip(rows, gross)
+        ]
+        return (
+            earnings_rows,
+            float(np.nan_to_num(gross).sum()),
+            float(np.nan_to_num(cpp).sum()),
+            float(np.nan_to_num(ei).sum()),
+            float(np.nan_to_num(net).sum()),
+        )
+
+    gross_total = cpp_total = ei_total = net_total = 0.0
+    earnings_rows = []
+    for r in rows:
+        gross = float(r.GrossAmount)
+        gross_total += gross
+        cpp_total += float(r.CPP or 0)
+        ei_total += float(r.EI or 0)
+        net_total += float(r.NetAmount)
+        earnings_rows.append((f"Gross {r.PeriodStart}–{r.PeriodEnd}", f"{gross:.2f}", ""))
+    return earnings_rows, gross_total, cpp_total, ei_total, net_total
+
+
+def _append_table_rows(table, rows_cells):
+    """Append many rows to a table via a single XML splice
+
+    python-docx's add_row() re-walks the table XML on every call, which is
+    O(N^2) over the number of rows. Building all <w:tr> elements in one
+    parse and extending the underlying <w:tbl> keeps it linear.
+    """
+    tr_xml = "".join(
+        "<w:tr>" + "".join(
+            f'<w:tc><w:p><w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p></w:tc>'
+            for text in cells
+        ) + "</w:tr>"
+        for cells in rows_cells
+    )
+    container = parse_xml(f"<w:root {nsdecls('w')}>{tr_xml}</w:root>")
+    table._tbl.extend(list(container))
+
+
+@lru_cache(maxsize=1)
+def _payslip_template_bytes():
+    """Read the payslip template once per process; None when not shipped"""
+    if not os.path.exists(_TEMPLATE_PATH):
+        return None
+    with open(_TEMPLATE_PATH, "rb") as f:
+        return f.read()
+
+
+def _render_payslip_from_template(tpl_bytes, rows):
+    """Fill the pre-built payslip template instead of building the document
+
+    The template carries the heading, styles, and table skeletons, so per
+    request only the placeholders are rendered. docxtpl templates are
+    single-shot after render(), hence the fresh instance from cached bytes.
+    """
+    earnings_rows, gross_total, cpp_total, ei_total, net_total = _aggregate_rows(rows)
+
+    tpl = DocxTemplate(io.BytesIO(tpl_bytes))
+    tpl.render({
+        "employee": rows[0].FullName,
+        "employee_number": rows[0].EmployeeNumber,
+        "period_start": rows[0].PeriodStart,
+        "period_end": rows[-1].PeriodEnd,
+        "rows": [{"description": desc, "amount": amount} for desc, amount, _ in earnings_rows],
+        "gross_total": f"{gross_total:.2f}",
+        "cpp_total": f"{cpp_total:.2f}",
+        "ei_total": f"{ei_total:.2f}",
+        "net_total": f"{net_total:.2f}",
+    })
+
+    buf = io.BytesIO()
+    tpl.save(buf)
+    buf.seek(0)
+    return buf
 
 
 def render_payslip_docx(rows):
     """Generate a paystub DOCX document from the database rows"""
-    if not rows: 
+    if not rows:
         raise ValueError("No pay data in range.")
-    
-    employee = rows[0]["FullName"]
-    empnum = rows[0]["EmployeeNumber"]
+
+    tpl_bytes = _payslip_template_bytes()
+    if tpl_bytes is not None:
+        return _render_payslip_from_template(tpl_bytes, rows)
+
+    employee = rows[0].FullName
+    empnum = rows[0].EmployeeNumber
 
     # Create new document
     doc = Document()
     doc.add_heading("Paystub", level=1)
     doc.add_paragraph(f"Employee Name: {employee}")
     doc.add_paragraph(f"Employee Number: {empnum}")
-    doc.add_paragraph(f"Pay Period: {rows[0]['PeriodStart']} to {rows[-1]['PeriodEnd']}")
+    doc.add_paragraph(f"Pay Period: {rows[0].PeriodStart} to {rows[-1].PeriodEnd}")
     doc.add_paragraph("")
 
     # Earnings section
@@ -53,23 +163,9 @@ def render_payslip_docx(rows):
     earnings_table.rows[0].cells[1].text = "Amount"
     earnings_table.rows[0].cells[2].text = "Notes"
 
-    gross_total = 0
-    net_total = 0
-    cpp_total = 0
-    ei_total = 0
-    
-    for r in rows:
-        row = earnings_table.add_row().cells
-        row[0].text = f"Gross {r['PeriodStart']}–{r['PeriodEnd']}"
-        row[1].text = f"{float(r['GrossAmount']):.2f}"
-        row[2].text = ""
-        gross_total += float(r['GrossAmount'])
-    
-    # Total row
-    row = earnings_table.add_row().cells
-    row[0].text = "Gross Total"
-    row[1].text = f"{gross_total:.2f}"
-    row[2].text = ""
+    earnings_rows, gross_total, cpp_total, ei_total, net_total = _aggregate_rows(rows)
+    earnings_rows.append(("Gross Total", f"{gross_total:.2f}", ""))
+    _append_table_rows(earnings_table, earnings_rows)
 
     # Deductions section
     doc.add_paragraph("")
@@ -77,23 +173,13 @@ def render_payslip_docx(rows):
     deductions_table = doc.add_table(rows=1, cols=2)
     deductions_table.rows[0].cells[0].text = "Deduction"
     deductions_table.rows[0].cells[1].text = "Amount"
-    
-    for r in rows:
-        cpp_total += float(r['CPP'] or 0)
-        ei_total += float(r['EI'] or 0)
-    
-    cpp_row = deductions_table.add_row().cells
-    cpp_row[0].text = "CPP"
-    cpp_row[1].text = f"{cpp_total:.2f}"
-    
-    ei_row = deductions_table.add_row().cells
-    ei_row[0].text = "EI"
-    ei_row[1].text = f"{ei_total:.2f}"
-
-    # Calculate net total
-    for r in rows:
-        net_total += float(r['NetAmount'])
-    
+
+    _append_table_rows(deductions_table, [
+        ("CPP", f"{cpp_total:.2f}"),
+        ("EI", f"{ei_total:.2f}"),
+    ])
+
+
     doc.add_paragraph("")
     doc.add_paragraph(f"NET PAY (sum of periods): {net_total:.2f}")
 
@@ -104,12 +190,17 @@ def render_payslip_docx(rows):
     return buf
 
 
-def upload_bytes_to_blob(container, blob_name, data_bytes):
-    """Upload bytes data to Azure Blob Storage using Azure Identity"""
+def upload_bytes_to_blob(container, blob_name, data):
+    """Upload bytes or a readable stream to Azure Blob Storage
+
+    Accepts a file-like object so callers can hand over a BytesIO without
+    a getvalue() copy; the SDK chunk-uploads large payloads in parallel.
+    """
     blob_client = get_blob_client()
     blob_client.get_container_client(container).upload_blob(
-        name=blob_name, 
-        data=data_bytes, 
-        overwrite=True
+        name=blob_name,
+        data=data,
+        overwrite=True,
+        max_concurrency=4
     )
     print(f"Uploaded {blob_name} to {container} container")
@@ -1,9 +1,16 @@
 from pypdf import PdfReader, PdfWriter
-from azure.storage.blob import BlobServiceClient
-from azure.identity import DefaultAzureCredential
+from pypdf.generic import BooleanObject, NameObject, NumberObject, TextStringObject
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import io
 import os
 
+from azure_clients import get_blob_client
+
+# Disk mirror for the immutable form templates, keyed by blob ETag so a
+# template rollout naturally invalidates stale copies
+_TEMPLATE_CACHE_DIR = "/tmp/hr_templates"
+
 
 def list_pdf_fields(pdf_bytes):
     """List all fillable fields in a PDF form"""
@@ -25,30 +32,29 @@ def fill_pdf_fields(pdf_bytes, field_map: dict):
     if reader.get_fields():
         print(f"Found form fields, attempting to fill {len(field_map)} values...")
         try:
-            # Try to update form field values
-            # Note: This might not work with all PDF forms, depending on their structure
-            for page_num in range(len(writer.pages)):
-                try:
-                    writer.update_page_form_field_values(writer.pages[page_num], field_map)
-                    print(f"Updated fields on page {page_num + 1}")
-                    break  # Success on first page is usually enough
-                except Exception as e:
-                    print(f"Page {page_num + 1} field update failed: {e}")
-                    continue
-            
-            # Try to flatten the form (make fields non-editable)
+            # All fields on these templates live on the first page; one
+            # update call is enough
+            writer.update_page_form_field_values(writer.pages[0], field_map)
+
+            # Ask the viewer to regenerate appearances for the new values
+            acro_form = writer._root_object.get("/AcroForm")
+            if acro_form is not None:
+                acro_form.get_object().update({NameObject("/NeedAppearances"): BooleanObject(True)})
+
+            # Try to flatten the form (make fields non-editable); iterate
+            # the page list directly instead of resolving writer.pages[i]
+            # per index, and use proper PDF objects for the update
             try:
-                for page_num in range(len(writer.pages)):
-                    annots = writer.pages[page_num].get("/Annots")
-                    if annots:
-                        for a in annots:
-                            annotation = a.get_object()
-                            if annotation:
-                                annotation.update({"/Ff": 1})
+                for page in writer.pages:
+                    annots = page.get("/Annots")
+                    if not annots:
+                        continue
+                    for a in annots:
+                        a.get_object().update({NameObject("/Ff"): NumberObject(1)})
                 print("Form flattened successfully")
             except Exception as e:
                 print(f"Form flattening failed: {e}")
-                
+
         except Exception as e:
             print(f"Form field update failed: {e}")
             print("Proceeding with blank PDF template...")
@@ -63,18 +69,135 @@ def fill_pdf_fields(pdf_bytes, field_map: dict):
     return out
 
 
-def get_blob_client():
-    """Get blob service client with Azure Identity or connection string fallback"""
+def _qualified_field_name(obj):
+    """Build an annotation's fully qualified field name by walking /Parent"""
+    parts = []
+    while obj is not None:
+        name = obj.get("/T")
+        if name:
+            parts.append(str(name))
+        parent = obj.get("/Parent")
+        obj = parent.get_object() if parent is not None else None
+    return ".".join(reversed(parts))
+
+
+def build_field_refs(writer):
+    """Map fully qualified field names to their annotation objects
+
+    update_page_form_field_values re-resolves every name against the
+    AcroForm tree on each call. The T4/T4A templates are fixed, so the
+    name-to-annotation mapping can be computed once per writer and reused
+    for every value written.
+    """
+    refs = {}
+    for page in writer.pages:
+        annots = page.get("/Annots")
+        if not annots:
+            continue
+        for a in annots:
+            obj = a.get_object()
+            name = _qualified_field_name(obj)
+            if name:
+                refs[name] = a
+    return refs
+
+
+def fast_fill(writer, refs, values):
+    """Write field values through precomputed refs - O(fields filled)"""
+    for name, value in values.items():
+        ref = refs.get(name)
+        if ref is not None:
+            ref.get_object().update({NameObject("/V"): TextStringObject(value)})
+
+
+def fill_pdf_fields_fast(pdf_bytes, field_map):
+    """Fill a known-shape form via precomputed field refs (batch-friendly)
+
+    Skips pypdf's per-field AcroForm walk and the diagnostics in
+    fill_pdf_fields; intended for year-end runs that stamp thousands of
+    slips from the same template.
+    """
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+
+    fast_fill(writer, build_field_refs(writer), field_map)
+
+    acro_form = writer._root_object.get("/AcroForm")
+    if acro_form is not None:
+        acro_form.get_object().update({NameObject("/NeedAppearances"): BooleanObject(True)})
+
+    out = io.BytesIO()
+    writer.write(out)
+    out.seek(0)
+    return out
+
+
+# Template bytes for process-pool workers, set once per worker via the
+# executor initializer so the 1-2 MB template isn't pickled per slip
+_worker_template = None
+
+
+def _init_fill_worker(pdf_bytes):
+    global _worker_template
+    _worker_template = pdf_bytes
+
+
+def _fill_one(field_map):
+    return fill_pdf_fields_fast(_worker_template, field_map).getvalue()
+
+
+def fill_many(pdf_bytes, field_maps):
+    """Fill one PDF template with many field maps, one slip per result
+
+    pypdf's write + form-fill path is CPU-bound and GIL-held, so batch
+    year-end runs are spread across a process pool; scaling is roughly
+    linear in core count. Returns the filled PDFs as bytes, in order.
+    """
+    if len(field_maps) <= 1:
+        return [fill_pdf_fields_fast(pdf_bytes, fm).getvalue() for fm in field_maps]
+
+    with ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        initializer=_init_fill_worker,
+        initargs=(pdf_bytes,),
+    ) as pool:
+        return list(pool.map(_fill_one, field_maps, chunksize=8))
+
+
+@lru_cache(maxsize=4)
+def get_template_bytes(blob_name):
+    """Get a PDF template's bytes, cached in memory and mirrored to disk
+
+    The T4/T4A templates are immutable per deployment, so repeated form
+    generation shouldn't re-download or re-fetch them. The in-process
+    cache serves the hot path; the /tmp mirror survives a restart.
+    """
+    blob = get_blob_client().get_blob_client(container="templates", blob=blob_name)
+
+    cache_path = None
     try:
-        # Try Azure Identity first (recommended for production)
-        credential = DefaultAzureCredential()
-        blob_cs = os.environ["BLOB_CONNECTION_STRING"]
-        account_name = blob_cs.split("AccountName=")[1].split(";")[0]
-        storage_url = f"https://{account_name}.blob.core.windows.net"
-        return BlobServiceClient(account_url=storage_url, credential=credential)
+        etag = blob.get_blob_properties().etag.strip('"')
+        cache_path = os.path.join(_TEMPLATE_CACHE_DIR, f"{etag}-{blob_name}")
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                return f.read()
     except Exception:
-        # Fallback to connection string
-        return BlobServiceClient.from_connection_string(os.environ["BLOB_CONNECTION_STRING"])
+        # Properties lookup failed - fall through to a plain download
+        pass
+
+    data = blob.download_blob().readall()
+
+    if cache_path:
+        try:
+            os.makedirs(_TEMPLATE_CACHE_DIR, exist_ok=True)
+            with open(cache_path, "wb") as f:
+                f.write(data)
+        except OSError:
+            pass  # Disk cache is best-effort
+
+    return data
 
 
 def download_blob_bytes(container, blob_name):
@@ -103,55 +226,71 @@ def fetch_tax_form_data(cnxn, employee_number, year, form_type):
         return None
 
 
+# Field names discovered via inspect_pdfs.py, in a fixed order shared by
+# both builders: last name, first name, SIN, year, income, tax deducted,
+# employer name. Using Slip1 (first slip on the page).
+_T4_KEYS = (
+    "form1[0].Page1[0].Slip1[0].Employee[0].LastName[0].Slip1LastName[0]",
+    "form1[0].Page1[0].Slip1[0].Employee[0].FirstName[0].Slip1FirstName[0]",
+    "form1[0].Page1[0].Slip1[0].Box12[0].Slip1Box12[0]",
+    "form1[0].Page1[0].Slip1[0].Year[0].Slip1Year[0]",
+    # Box14 (Employment Income) and Box22 (Income Tax Deducted)
+    "form1[0].Page1[0].Slip1[0].Box14[0].Slip1Box14[0]",
+    "form1[0].Page1[0].Slip1[0].Box22[0].Slip1Box22[0]",
+    "form1[0].Page1[0].Slip1[0].EmployersName[0].Slip1EmployersName[0]",
+)
+
+_T4A_KEYS = (
+    "form1[0].Page1[0].Slip1[0].Employee[0].LastName[0].Slip1LastName[0]",
+    "form1[0].Page1[0].Slip1[0].Employee[0].FirstName[0].Slip1FirstName[0]",
+    "form1[0].Page1[0].Slip1[0].Box12[0].Slip1SIN[0]",
+    "form1[0].Page1[0].Slip1[0].Year[0].Slip1Year[0]",
+    # T4A uses Line16 and Line22 instead of Box14/Box22
+    "form1[0].Page1[0].Slip1[0].Line16[0].Slip1Line16[0]",
+    "form1[0].Page1[0].Slip1[0].Line22[0].Slip1Line22[0]",
+    "form1[0].Page1[0].Slip1[0].EmployersName[0].Slip1EmployersName[0]",
+)
+
+# Employer information (you may want to customize this)
+_EMPLOYER_NAME = "TD Bank Group"
+
+
+def _amount(value):
+    """Format a numeric value as a two-decimal amount string"""
+    return f"{float(value):.2f}"
+
+
+def _split_name(full_name):
+    """Split a full name into (first, last); a single token becomes the last name"""
+    if " " in full_name:
+        parts = full_name.split()
+        return parts[0], parts[-1]
+    return "", full_name
+
+
+def _slip_values(data):
+    """Build the ordered slip values shared by the T4 and T4A field maps"""
+    first, last = _split_name(data["FullName"])
+    return (
+        last,
+        first,
+        data["SIN"],
+        str(data["Year"]),
+        _amount(data["EmploymentIncome"]),
+        _amount(data["IncomeTaxDeducted"]),
+        _EMPLOYER_NAME,
+    )
+
+
 def create_t4_field_map(data):
     """Create field mapping for T4 form based on database data"""
     if not data:
         raise ValueError("No tax data found")
-    
-    # Based on the PDF inspection, these are the actual field names for T4
-    # Using Slip1 (first slip on the page)
-    field_map = {
-        # Employee information
-        "form1[0].Page1[0].Slip1[0].Employee[0].LastName[0].Slip1LastName[0]": data["FullName"].split()[-1] if " " in data["FullName"] else data["FullName"],
-        "form1[0].Page1[0].Slip1[0].Employee[0].FirstName[0].Slip1FirstName[0]": data["FullName"].split()[0] if " " in data["FullName"] else "",
-        "form1[0].Page1[0].Slip1[0].Box12[0].Slip1Box12[0]": data["SIN"],  # SIN field
-        
-        # Year
-        "form1[0].Page1[0].Slip1[0].Year[0].Slip1Year[0]": str(data["Year"]),
-        
-        # Tax amounts - using Box14 (Employment Income) and Box22 (Income Tax Deducted)
-        "form1[0].Page1[0].Slip1[0].Box14[0].Slip1Box14[0]": f"{float(data['EmploymentIncome']):.2f}",
-        "form1[0].Page1[0].Slip1[0].Box22[0].Slip1Box22[0]": f"{float(data['IncomeTaxDeducted']):.2f}",
-        
-        # Employer information (you may want to customize these)
-        "form1[0].Page1[0].Slip1[0].EmployersName[0].Slip1EmployersName[0]": "TD Bank Group",
-        # Add more fields as needed
-    }
-    return field_map
+    return dict(zip(_T4_KEYS, _slip_values(data)))
 
 
 def create_t4a_field_map(data):
     """Create field mapping for T4A form based on database data"""
     if not data:
         raise ValueError("No tax data found")
-    
-    # Based on the PDF inspection, these are the actual field names for T4A
-    # Using Slip1 (first slip on the page)
-    field_map = {
-        # Employee information
-        "form1[0].Page1[0].Slip1[0].Employee[0].LastName[0].Slip1LastName[0]": data["FullName"].split()[-1] if " " in data["FullName"] else data["FullName"],
-        "form1[0].Page1[0].Slip1[0].Employee[0].FirstName[0].Slip1FirstName[0]": data["FullName"].split()[0] if " " in data["FullName"] else "",
-        "form1[0].Page1[0].Slip1[0].Box12[0].Slip1SIN[0]": data["SIN"],  # SIN field for T4A
-        
-        # Year
-        "form1[0].Page1[0].Slip1[0].Year[0].Slip1Year[0]": str(data["Year"]),
-        
-        # T4A uses Line16 and Line22 instead of Box14/Box22
-        "form1[0].Page1[0].Slip1[0].Line16[0].Slip1Line16[0]": f"{float(data['EmploymentIncome']):.2f}",
-        "form1[0].Page1[0].Slip1[0].Line22[0].Slip1Line22[0]": f"{float(data['IncomeTaxDeducted']):.2f}",
-        
-        # Employer information
-        "form1[0].Page1[0].Slip1[0].EmployersName[0].Slip1EmployersName[0]": "TD Bank Group",
-        # Add more fields as needed
-    }
-    return field_map
+    return dict(zip(_T4A_KEYS, _slip_values(data)))
@@ -1,56 +1,85 @@
+import asyncio
+import calendar
+import collections
+import copy
+import functools
 import json
+import logging
 import os
+import re
+import threading
+import orjson
 import tiktoken
-from openai import AzureOpenAI
+import cachetools.func
+from cachetools import TTLCache
+from openai import AzureOpenAI, AsyncAzureOpenAI
 
+logger = logging.getLogger(__name__)
 
+
+@functools.lru_cache(maxsize=4)
+def _get_encoding(model):
+    """Load a tiktoken encoding once per model
+
+    encoding_for_model parses the whole BPE merge table, which dwarfs the
+    actual encode cost for the short prompts in this module.
+    """
+    return tiktoken.encoding_for_model(model)
+
+
+@functools.lru_cache(maxsize=1024)
 def count_tokens(text, model="gpt-4o"):
     """
     Count tokens in text using tiktoken for the specified model
-    
+
+    Results are memoized so repeated literals (like the system prompt)
+    never re-encode. Raises if the encoding can't be loaded - the old
+    len(text) // 4 estimate could silently feed wrong counts into
+    billing, which is worse than failing loudly.
+
     Args:
         text: Text to count tokens for
         model: Model name (default: gpt-4o)
-    
+
     Returns:
         int: Number of tokens
     """
-    try:
-        # Use gpt-4 encoding for gpt-4o (they use the same tokenizer)
-        encoding = tiktoken.encoding_for_model("gpt-4")
-        return len(encoding.encode(text))
-    except Exception as e:
-        print(f"Warning: Token counting failed ({e}), estimating...")
-        # Rough estimate: ~4 characters per token
-        return len(text) // 4
-
-
-SYSTEM_PROMPT = """You classify HR document requests into one of these intents:
-1) PAYSLIP_SELF {fromDate, toDate}
-2) PAYSLIP_ON_BEHALF {employeeNumber, fromDate, toDate}
-3) PAYSLIP_BY_NAME {employeeName, fromDate, toDate} - when employee name is provided instead of number
-4) T4_SELF {year}
-5) T4_ON_BEHALF {employeeNumber, year}
-6) T4_BY_NAME {employeeName, year} - when employee name is provided instead of number
-7) T4A_SELF {year}
-8) T4A_ON_BEHALF {employeeNumber, year}
-9) T4A_BY_NAME {employeeName, year} - when employee name is provided instead of number
-
-Return JSON with: {"intent": "...", "parameters": {...}, "missing": [...]}
-
-Examples:
-- "Provide my paystub for March 2022" → {"intent": "PAYSLIP_SELF", "parameters": {"fromDate": "2022-03-01", "toDate": "2022-03-31"}, "missing": []}
-- "Get T4 for employee 556677 for 2023" → {"intent": "T4_ON_BEHALF", "parameters": {"employeeNumber": "556677", "year": 2023}, "missing": []}
-- "Get paystub for Alex Martin from January 2022" → {"intent": "PAYSLIP_BY_NAME", "parameters": {"employeeName": "Alex Martin", "fromDate": "2022-01-01", "toDate": "2022-01-31"}, "missing": []}
-- "I need my T4 form" → {"intent": "T4_SELF", "parameters": {}, "missing": ["year"]}
-
-If information is missing, list it in the "missing" array and ask for clarification.
-Always extract dates in YYYY-MM-DD format. For month/year only requests, use first and last day of that period.
-Use BY_NAME intents when a person's name (like "Alex", "John Smith", etc.) is mentioned instead of an employee number.
+    # Use gpt-4 encoding for gpt-4o (they use the same tokenizer)
+    return len(_get_encoding("gpt-4").encode(text))
+
+
+# DO NOT MODIFY without need: this prompt is sent byte-identical on every
+# call so Azure OpenAI's automatic prompt caching can reuse the precomputed
+# prefix (lower TTFT, discounted input tokens). Never interpolate per-call
+# values (timestamps, user data) into it - user content goes in its own
+# message. Every token here is billed and prefilled on every call, hence
+# the terse grammar form.
+SYSTEM_PROMPT = """You classify HR document requests.
+Intents (with required parameters):
+PAYSLIP_SELF{fromDate,toDate}; PAYSLIP_ON_BEHALF{employeeNumber,fromDate,toDate}; PAYSLIP_BY_NAME{employeeName,fromDate,toDate}
+T4_SELF{year}; T4_ON_BEHALF{employeeNumber,year}; T4_BY_NAME{employeeName,year}
+T4A_SELF{year}; T4A_ON_BEHALF{employeeNumber,year}; T4A_BY_NAME{employeeName,year}
+Rules: Use _BY_NAME when a person's name is given instead of an employee number. Dates are YYYY-MM-DD; a month/year alone means its first and last day. List parameters that were not provided in "missing".
+Example: "Provide my paystub for March 2022" → {"intent": "PAYSLIP_SELF", "parameters": {"fromDate": "2022-03-01", "toDate": "2022-03-31"}, "missing": []}
+Respond with a single JSON object {"intent": "...", "parameters": {...}, "missing": [...]}, no prose.
 """
 
 
-def get_azure_openai_client():
+def _fallback_token_info(user_request):
+    """Estimate token usage locally when no API response was obtained"""
+    try:
+        input_tokens = count_tokens(SYSTEM_PROMPT + "\n" + user_request)
+    except Exception:
+        # Error path only - never mask a real result over a count failure
+        input_tokens = 0
+    return {"input_tokens": input_tokens, "output_tokens": 0, "total_tokens": input_tokens}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _build_azure_openai_client():
     """Initialize Azure OpenAI client from environment variables"""
     try:
         return AzureOpenAI(
@@ -70,6 +99,246 @@ def get_azure_openai_client():
             raise e
 
 
+def get_azure_openai_client():
+    """Get the shared Azure OpenAI client, building it lazily on first use
+
+    A single client means a single underlying httpx connection pool, so
+    repeated classifications reuse warm keep-alive connections instead of
+    paying DNS + TCP + TLS setup on every call.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_azure_openai_client()
+    return _client
+
+
+# Deterministic pre-classifier patterns: requests these can resolve
+# unambiguously never need the LLM round-trip
+_DOC_TYPE_RE = re.compile(r"\b(t4a|t4|pay[-\s]?(?:slip|stub))\b", re.I)
+_YEAR_RE = re.compile(r"\b((?:19|20)\d{2})\b")
+_MONTH_RE = re.compile(
+    r"\b(january|february|march|april|may|june|july|august|september|october|november|december)\b",
+    re.I,
+)
+_EMPLOYEE_NUM_RE = re.compile(r"\bemployee\s+(?:number\s+)?(\d+)\b", re.I)
+_SELF_RE = re.compile(r"\b(my|me|mine)\b", re.I)
+# Signals that the request may concern someone other than the requester
+# even when a self pronoun appears ("my colleague Alex", "my manager's
+# T4", "send me Alex Martin's payslip"): a possessive, a relationship
+# word, or a capitalized First Last candidate name. Any of these means
+# the fast path must defer to the LLM rather than guess _SELF.
+_OTHER_PERSON_RE = re.compile(
+    r"'s\b"
+    r"|(?i:\b(?:colleague|co-?worker|manager|boss|supervisor|teammate"
+    r"|direct report|assistant|spouse|friend)\b)"
+    r"|\b[A-Z][a-z]+\s+[A-Z][a-z]+\b"
+)
+
+_MONTH_NUMBERS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+
+
+def _fast_classify(user_request, current_user_employee_number=None):
+    """Classify trivially patterned requests with regexes instead of the LLM
+
+    Handles the unambiguous cases - an explicit document type plus either
+    "my ..." or "employee <number>", with a single year (and a single
+    month for payslips). Returns the same result shape as the LLM path,
+    or None when anything is uncertain (e.g. name-based requests).
+    """
+    doc_match = _DOC_TYPE_RE.search(user_request)
+    if not doc_match:
+        return None
+    doc = doc_match.group(1).lower()
+    doc_type = "T4A" if doc == "t4a" else ("T4" if doc == "t4" else "PAYSLIP")
+
+    emp_match = _EMPLOYEE_NUM_RE.search(user_request)
+    is_self = _SELF_RE.search(user_request) is not None
+    if (emp_match and is_self) or (not emp_match and not is_self):
+        # Mixed or missing subject signals (likely a name-based request)
+        return None
+    if _OTHER_PERSON_RE.search(user_request):
+        # Another person may be the subject despite the self/number signal
+        return None
+
+    # A 4-digit employee number ("employee 2023") also matches _YEAR_RE;
+    # don't let it double as the year - that would fabricate a parameter
+    # the user never gave, where the LLM path reports year as missing
+    emp_span = emp_match.span(1) if emp_match else None
+    years = [
+        m.group(1)
+        for m in _YEAR_RE.finditer(user_request)
+        if emp_span is None or m.end(1) <= emp_span[0] or m.start(1) >= emp_span[1]
+    ]
+    if len(years) != 1:
+        return None
+    year = int(years[0])
+
+    if doc_type == "PAYSLIP":
+        months = _MONTH_RE.findall(user_request)
+        if len(months) != 1:
+            # No month, or a range - leave date interpretation to the LLM
+            return None
+        month = _MONTH_NUMBERS[months[0].lower()]
+        last_day = calendar.monthrange(year, month)[1]
+        parameters = {
+            "fromDate": f"{year:04d}-{month:02d}-01",
+            "toDate": f"{year:04d}-{month:02d}-{last_day:02d}",
+        }
+    else:
+        parameters = {"year": year}
+
+    if emp_match:
+        intent = f"{doc_type}_ON_BEHALF"
+        parameters["employeeNumber"] = emp_match.group(1)
+    else:
+        intent = f"{doc_type}_SELF"
+        if current_user_employee_number:
+            parameters["employeeNumber"] = current_user_employee_number
+
+    return {
+        "intent": intent,
+        "parameters": parameters,
+        "missing": [],
+        "token_info": {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0},
+    }
+
+
+# HR requests are highly repetitive; identical ones shouldn't re-pay LLM
+# latency or token cost for an hour
+_RESP_CACHE = TTLCache(maxsize=4096, ttl=3600)
+_resp_cache_lock = threading.Lock()
+_WS_RE = re.compile(r"\s+")
+
+
+def _classify_create_kwargs(messages):
+    """Shared create() arguments for the sync and async classification calls"""
+    return {
+        # Intent classification is trivial for a small model; a dedicated
+        # gpt-4o-mini deployment is faster and ~20x cheaper per call
+        "model": os.environ.get("AOAI_CLASSIFY_DEPLOYMENT") or os.environ["AOAI_DEPLOYMENT"],
+        "messages": messages,
+        "temperature": 0.1,
+        # The classification JSON is well under 80 tokens; a tight cap
+        # keeps the server from budgeting decode steps we never use
+        "max_tokens": 120,
+        # JSON mode guarantees syntactically valid, unfenced output
+        "response_format": {"type": "json_object"},
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+
+
+def _chunk_usage_delta(chunk, usage):
+    """Extract (usage, content delta) from one streamed chunk"""
+    if chunk.usage is not None:
+        usage = chunk.usage
+    if not chunk.choices:
+        return usage, None
+    return usage, chunk.choices[0].delta.content or None
+
+
+def _drain_classification_stream(response):
+    """Collect streamed content until the JSON object closes, then usage
+
+    Content after the closing brace is ignored, but the stream is still
+    consumed to the end: the include_usage chunk arrives after the final
+    content chunk, and finishing the SSE body lets httpx return the
+    connection to the shared client's keep-alive pool. The trailing
+    chunks are empty, so reading them costs nothing.
+    """
+    parts = []
+    usage = None
+    depth = 0
+    opened = False
+    closed = False
+    for chunk in response:
+        usage, delta = _chunk_usage_delta(chunk, usage)
+        if delta is None or closed:
+            continue
+        parts.append(delta)
+        depth += delta.count("{") - delta.count("}")
+        opened = opened or "{" in delta
+        closed = opened and depth == 0
+    return "".join(parts), usage
+
+
+async def _drain_classification_stream_async(response):
+    """Async twin of _drain_classification_stream"""
+    parts = []
+    usage = None
+    depth = 0
+    opened = False
+    closed = False
+    async for chunk in response:
+        usage, delta = _chunk_usage_delta(chunk, usage)
+        if delta is None or closed:
+            continue
+        parts.append(delta)
+        depth += delta.count("{") - delta.count("}")
+        opened = opened or "{" in delta
+        closed = opened and depth == 0
+    return "".join(parts), usage
+
+
+def _token_info_from(usage, user_request, raw_content):
+    """Prefer the server-reported usage; estimate locally only if the
+    stream somehow ended without its usage chunk"""
+    if usage is not None:
+        return {
+            "input_tokens": usage.prompt_tokens,
+            "output_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens
+        }
+    token_info = _fallback_token_info(user_request)
+    try:
+        token_info["output_tokens"] = count_tokens(raw_content)
+    except Exception:
+        token_info["output_tokens"] = 0
+    token_info["total_tokens"] = token_info["input_tokens"] + token_info["output_tokens"]
+    return token_info
+
+
+def _error_result(error, token_info):
+    return {
+        "intent": "ERROR",
+        "parameters": {},
+        "missing": [],
+        "error": error,
+        "token_info": token_info
+    }
+
+
+def _finalize_classification(raw_content, token_info, current_user_employee_number, cache_key):
+    """Parse the model output and assemble the classification result"""
+    # %s-style args so formatting is skipped entirely unless DEBUG is on;
+    # print() here would serialize concurrent callers on stdout
+    logger.debug("Token usage - Input: %s, Output: %s, Total: %s",
+                 token_info['input_tokens'], token_info['output_tokens'], token_info['total_tokens'])
+
+    if not raw_content or raw_content.strip() == "":
+        return _error_result("AI returned empty response", token_info)
+
+    # JSON mode means no markdown fences to strip; the parse below is
+    # defensive and should never fail
+    result = orjson.loads(raw_content.strip())
+
+    # Add current user's employee number for _SELF requests
+    if current_user_employee_number and result["intent"].endswith("_SELF"):
+        result["parameters"]["employeeNumber"] = current_user_employee_number
+
+    # Add token information to result
+    result["token_info"] = token_info
+
+    # Cache good classifications only; ERROR results should retry
+    if result["intent"] != "ERROR":
+        with _resp_cache_lock:
+            _RESP_CACHE[cache_key] = copy.deepcopy(result)
+
+    return result
+
+
 def classify_request(user_request, current_user_employee_number=None):
     """
     Classify a user request and extract parameters
@@ -81,189 +350,332 @@ def classify_request(user_request, current_user_employee_number=None):
     Returns:
         dict: Classification result with intent, parameters, missing fields, and token info
     """
+    # Deterministic fast path: obvious requests resolve in microseconds
+    # of regex work and cost zero tokens
+    fast_result = _fast_classify(user_request, current_user_employee_number)
+    if fast_result is not None:
+        return fast_result
+
+    cache_key = (_WS_RE.sub(" ", user_request.strip().lower()), current_user_employee_number)
+    with _resp_cache_lock:
+        cached = _RESP_CACHE.get(cache_key)
+    if cached is not None:
+        # Deep copy so callers mutating parameters don't poison the cache
+        return copy.deepcopy(cached)
+
     client = get_azure_openai_client()
-    
+
     messages = [
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": user_request}
     ]
-    
-    # Count input tokens
-    input_text = SYSTEM_PROMPT + "\n" + user_request
-    input_tokens = count_tokens(input_text)
-    
+
     try:
-        response = client.chat.completions.create(
-            model=os.environ["AOAI_DEPLOYMENT"],
-            messages=messages,
-            temperature=0.1,
-            max_tokens=500
+        response = client.chat.completions.create(**_classify_create_kwargs(messages))
+        raw_content, usage = _drain_classification_stream(response)
+        token_info = _token_info_from(usage, user_request, raw_content)
+        return _finalize_classification(raw_content, token_info, current_user_employee_number, cache_key)
+
+    except (orjson.JSONDecodeError, json.JSONDecodeError, ValueError) as e:
+        if 'token_info' not in locals():
+            token_info = _fallback_token_info(user_request)
+        return _error_result(
+            f"Failed to parse AI response: {e}. Raw response: '{raw_content if 'raw_content' in locals() else 'N/A'}'",
+            token_info
         )
-        
-        raw_content = response.choices[0].message.content
-        
-        # Count output tokens
-        output_tokens = count_tokens(raw_content)
-        total_tokens = input_tokens + output_tokens
-        
-        # Create token info
-        token_info = {
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens,
-            "total_tokens": total_tokens
-        }
-        
-        # Display token information (optional - can be removed for production)
-        print(f"Token usage - Input: {input_tokens:,}, Output: {output_tokens:,}, Total: {total_tokens:,}")
-        
-        if not raw_content or raw_content.strip() == "":
-            return {
-                "intent": "ERROR",
-                "parameters": {},
-                "missing": [],
-                "error": "AI returned empty response",
-                "token_info": token_info
-            }
-        
-        # Handle markdown-wrapped JSON (remove ```json and ``` markers)
-        json_content = raw_content.strip()
-        if json_content.startswith("```json"):
-            json_content = json_content[7:]  # Remove ```json
-        if json_content.startswith("```"):
-            json_content = json_content[3:]   # Remove ```
-        if json_content.endswith("```"):
-            json_content = json_content[:-3]  # Remove trailing ```
-        json_content = json_content.strip()
-        
-        result = json.loads(json_content)
-        
-        # Add current user's employee number for _SELF requests
-        if current_user_employee_number and result["intent"].endswith("_SELF"):
-            result["parameters"]["employeeNumber"] = current_user_employee_number
-        
-        # Add token information to result
-        result["token_info"] = token_info
-        
-        return result
-        
-    except json.JSONDecodeError as e:
-        token_info = {"input_tokens": input_tokens, "output_tokens": 0, "total_tokens": input_tokens} if 'input_tokens' in locals() else {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
-        return {
-            "intent": "ERROR",
-            "parameters": {},
-            "missing": [],
-            "error": f"Failed to parse AI response: {e}. Raw response: '{raw_content if 'raw_content' in locals() else 'N/A'}'. Cleaned: '{json_content if 'json_content' in locals() else 'N/A'}'",
-            "token_info": token_info
-        }
     except Exception as e:
-        token_info = {"input_tokens": input_tokens, "output_tokens": 0, "total_tokens": input_tokens} if 'input_tokens' in locals() else {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
-        return {
-            "intent": "ERROR", 
-            "parameters": {},
-            "missing": [],
-            "error": f"AI classification failed: {e}",
-            "token_info": token_info
-        }
+        if 'token_info' not in locals():
+            token_info = _fallback_token_info(user_request)
+        return _error_result(f"AI classification failed: {e}", token_info)
+
+
+_async_client = None
+_async_client_lock = threading.Lock()
+
+
+def get_async_azure_openai_client():
+    """Get the shared AsyncAzureOpenAI client, building it lazily on first use"""
+    global _async_client
+    if _async_client is None:
+        with _async_client_lock:
+            if _async_client is None:
+                _async_client = AsyncAzureOpenAI(
+                    api_key=os.environ["AOAI_API_KEY"],
+                    api_version=os.environ.get("OPENAI_API_VERSION", "2024-12-01-preview"),
+                    azure_endpoint=os.environ["AOAI_ENDPOINT"]
+                )
+    return _async_client
+
+
+async def classify_request_async(user_request, current_user_employee_number=None):
+    """Async variant of classify_request for concurrent callers
+
+    Same fast path, cache, and result shape as the sync version; only the
+    network call and stream consumption are awaited.
+    """
+    fast_result = _fast_classify(user_request, current_user_employee_number)
+    if fast_result is not None:
+        return fast_result
+
+    cache_key = (_WS_RE.sub(" ", user_request.strip().lower()), current_user_employee_number)
+    with _resp_cache_lock:
+        cached = _RESP_CACHE.get(cache_key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    client = get_async_azure_openai_client()
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_request}
+    ]
+
+    try:
+        response = await client.chat.completions.create(**_classify_create_kwargs(messages))
+        raw_content, usage = await _drain_classification_stream_async(response)
+        token_info = _token_info_from(usage, user_request, raw_content)
+        return _finalize_classification(raw_content, token_info, current_user_employee_number, cache_key)
+
+    except (orjson.JSONDecodeError, json.JSONDecodeError, ValueError) as e:
+        if 'token_info' not in locals():
+            token_info = _fallback_token_info(user_request)
+        return _error_result(
+            f"Failed to parse AI response: {e}. Raw response: '{raw_content if 'raw_content' in locals() else 'N/A'}'",
+            token_info
+        )
+    except Exception as e:
+        if 'token_info' not in locals():
+            token_info = _fallback_token_info(user_request)
+        return _error_result(f"AI classification failed: {e}", token_info)
+
+
+async def classify_many(user_requests, current_user_employee_number=None, limit=16):
+    """Classify many requests concurrently
+
+    Wall-clock time approaches that of the slowest single call instead of
+    the sum; the semaphore caps in-flight calls so batch jobs stay under
+    the deployment's rate limits.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def classify_one(user_request):
+        async with semaphore:
+            return await classify_request_async(user_request, current_user_employee_number)
+
+    return await asyncio.gather(*(classify_one(r) for r in user_requests))
+
+
+# Built once instead of per validate_parameters call; tuples keep the
+# declaration order, so the missing-parameters list users see is stable
+_REQUIRED_PARAMS = {
+    "PAYSLIP_SELF": ("employeeNumber", "fromDate", "toDate"),
+    "PAYSLIP_ON_BEHALF": ("employeeNumber", "fromDate", "toDate"),
+    "PAYSLIP_BY_NAME": ("employeeName", "fromDate", "toDate"),
+    "T4_SELF": ("employeeNumber", "year"),
+    "T4_ON_BEHALF": ("employeeNumber", "year"),
+    "T4_BY_NAME": ("employeeName", "year"),
+    "T4A_SELF": ("employeeNumber", "year"),
+    "T4A_ON_BEHALF": ("employeeNumber", "year"),
+    "T4A_BY_NAME": ("employeeName", "year"),
+}
 
 
 def validate_parameters(intent, parameters):
     """
     Validate that all required parameters are present for the given intent
-    
+
     Returns:
-        list: Missing required parameters
+        list: Missing required parameters (absent or empty values)
     """
-    required_params = {
-        "PAYSLIP_SELF": ["employeeNumber", "fromDate", "toDate"],
-        "PAYSLIP_ON_BEHALF": ["employeeNumber", "fromDate", "toDate"],
-        "PAYSLIP_BY_NAME": ["employeeName", "fromDate", "toDate"],
-        "T4_SELF": ["employeeNumber", "year"],
-        "T4_ON_BEHALF": ["employeeNumber", "year"],
-        "T4_BY_NAME": ["employeeName", "year"],
-        "T4A_SELF": ["employeeNumber", "year"],
-        "T4A_ON_BEHALF": ["employeeNumber", "year"],
-        "T4A_BY_NAME": ["employeeName", "year"]
-    }
-    
-    if intent not in required_params:
+    required = _REQUIRED_PARAMS.get(intent)
+    if not required:
         return []
-    
-    missing = []
-    for param in required_params[intent]:
-        if param not in parameters or not parameters[param]:
-            missing.append(param)
-    
-    return missing
+    # parameters.get covers both "key absent" and "value empty/falsy"
+    return [param for param in required if not parameters.get(param)]
+
+
+# One shared row type: a single allocation per match with C-level
+# attribute access, instead of a dict (and its key hashing) per row
+Employee = collections.namedtuple("Employee", ["EmployeeNumber", "FullName"])
+
+# The search SQL must stay byte-identical across calls: pyodbc reuses the
+# server-side prepared statement when the same cursor re-executes the
+# same text, skipping the per-call parse/plan round-trip
+_SEARCH_SQL = """
+    SELECT TOP 50 EmployeeNumber, FullName
+    FROM Employees
+    WHERE FullName LIKE ?
+    ORDER BY FullName
+"""
+
+# One cursor per connection; the cursor keeps its connection alive, so
+# the id() keys can't be recycled while an entry is cached. Whoever
+# closes a connection must call discard_search_cursor() so the entry is
+# evicted and the dead connection can actually be collected.
+_search_cursors = {}
+
+
+def _search_cursor(cnxn):
+    cur = _search_cursors.get(id(cnxn))
+    if cur is None:
+        cur = _search_cursors[id(cnxn)] = cnxn.cursor()
+    return cur
+
+
+def discard_search_cursor(cnxn):
+    """Evict the cached search cursor for a connection being discarded
+
+    The connection pool calls this before closing a broken connection;
+    without it the cursor entry would pin the closed connection object
+    in _search_cursors forever.
+    """
+    cur = _search_cursors.pop(id(cnxn), None)
+    if cur is not None:
+        try:
+            cur.close()
+        except Exception:
+            pass
 
 
 def search_employees_by_name(cnxn, employee_name):
     """
     Search for employees by name and return matching records
-    
+
     Args:
         cnxn: Database connection
         employee_name: Name to search for (can be partial)
-    
+
     Returns:
-        list: List of matching employee records with EmployeeNumber and FullName
+        list: List of matching Employee tuples (EmployeeNumber, FullName)
     """
-    with cnxn.cursor() as cur:
-        # Search for employees with names containing the search term
-        cur.execute("""
-            SELECT DISTINCT EmployeeNumber, FullName
-            FROM Employees 
-            WHERE FullName LIKE ?
-            ORDER BY FullName
-        """, (f"%{employee_name}%",))
-        
-        cols = [c[0] for c in cur.description]
-        return [dict(zip(cols, r)) for r in cur.fetchall()]
-
-
-def confirm_employee_selection(matches, requested_name):
+    # Try a prefix pattern first so single-token first-name searches get
+    # an index seek on FullName; names are stored "First Last", so a
+    # surname-only search ("martin") finds nothing by prefix and falls
+    # back to the contains scan the baseline always paid. Multi-word
+    # input goes straight to contains. EmployeeNumber is unique, so
+    # DISTINCT was redundant, and TOP bounds the transfer for broad terms.
+    if " " in employee_name.strip():
+        patterns = (f"%{employee_name}%",)
+    else:
+        patterns = (f"{employee_name}%", f"%{employee_name}%")
+
+    matches = []
+    for pattern in patterns:
+        cur = _search_cursor(cnxn)
+        try:
+            cur.execute(_SEARCH_SQL, (pattern,))
+        except Exception:
+            # The cached cursor can go stale if its connection was
+            # recycled; rebuild once and retry
+            cur = _search_cursors[id(cnxn)] = cnxn.cursor()
+            cur.execute(_SEARCH_SQL, (pattern,))
+
+        # Drain in chunks rather than one fetchall so a broad pattern
+        # never materializes the whole result set at once; stop at the cap
+        while len(matches) < 50:
+            batch = cur.fetchmany(200)
+            if not batch:
+                break
+            matches.extend(Employee._make(r) for r in batch)
+        if matches:
+            break
+    return matches[:50]
+
+
+# Connection used by the cached search wrapper, registered per thread so
+# the cache key can be just the name
+_search_connection = threading.local()
+
+
+def register_search_connection(cnxn):
+    """Register the connection the cached name search uses on this thread"""
+    _search_connection.cnxn = cnxn
+
+
+@cachetools.func.ttl_cache(maxsize=512, ttl=60)
+def _search_cached(employee_name):
+    cnxn = getattr(_search_connection, "cnxn", None)
+    if cnxn is None:
+        raise RuntimeError(
+            "No search connection registered for this thread; "
+            "call register_search_connection() first"
+        )
+    return search_employees_by_name(cnxn, employee_name)
+
+
+def search_employees_by_name_cached(employee_name):
+    """Name search with a 60-second in-process cache
+
+    Interactive flows search the same or narrowing names repeatedly
+    ("Alex", then "Alex Martin"); repeats within the TTL skip the SQL
+    round-trip entirely. Requires register_search_connection() on the
+    calling thread. Call .cache_clear() after employee-update operations.
     """
-    Handle employee selection when multiple matches are found
-    
+    return _search_cached(employee_name.lower().strip())
+
+
+search_employees_by_name_cached.cache_clear = _search_cached.cache_clear
+
+
+def _interactive_chooser(matches):
+    """Default chooser: prompt on stdin for an index into matches, or None"""
+    count = len(matches)
+    while True:
+        choice = input(f"Select employee (1-{count}) or 'c' to cancel: ").strip()
+        if choice.lower() == 'c':
+            return None
+        if choice.isdigit():
+            index = int(choice) - 1
+            if 0 <= index < count:
+                return index
+            print(f"Please enter a number between 1 and {count}")
+        else:
+            print("Please enter a valid number or 'c' to cancel")
+
+
+def _resolve_employee(matches, requested_name, chooser=None):
+    """Resolve a name search down to one employee number
+
     Args:
         matches: List of employee records
         requested_name: The name that was originally requested
-    
+        chooser: Optional callable (matches) -> index or None. Server and
+            batch callers pass one so resolution never blocks on a TTY;
+            when omitted, the interactive stdin flow is used.
+
     Returns:
         str: Selected employee number or None if cancelled
     """
     if not matches:
         print(f"No employees found matching '{requested_name}'")
         return None
-    
+
+    if chooser is not None:
+        index = chooser(matches)
+        return matches[index].EmployeeNumber if index is not None else None
+
     if len(matches) == 1:
         employee = matches[0]
-        print(f"Found employee: {employee['FullName']} (ID: {employee['EmployeeNumber']})")
+        print(f"Found employee: {employee.FullName} (ID: {employee.EmployeeNumber})")
         confirm = input("Is this correct? (y/n): ").strip().lower()
-        if confirm == 'y':
-            return employee['EmployeeNumber']
-        else:
-            return None
-    
+        return employee.EmployeeNumber if confirm == 'y' else None
+
     # Multiple matches found
     print(f"\nMultiple employees found matching '{requested_name}':")
     for i, employee in enumerate(matches, 1):
-        print(f"  {i}. {employee['FullName']} (ID: {employee['EmployeeNumber']})")
-    
-    while True:
-        try:
-            choice = input(f"Select employee (1-{len(matches)}) or 'c' to cancel: ").strip()
-            if choice.lower() == 'c':
-                return None
-            
-            index = int(choice) - 1
-            if 0 <= index < len(matches):
-                selected = matches[index]
-                print(f"Selected: {selected['FullName']} (ID: {selected['EmployeeNumber']})")
-                return selected['EmployeeNumber']
-            else:
-                print(f"Please enter a number between 1 and {len(matches)}")
-        except ValueError:
-            print("Please enter a valid number or 'c' to cancel")
+        print(f"  {i}. {employee.FullName} (ID: {employee.EmployeeNumber})")
+
+    index = _interactive_chooser(matches)
+    if index is None:
+        return None
+    selected = matches[index]
+    print(f"Selected: {selected.FullName} (ID: {selected.EmployeeNumber})")
+    return selected.EmployeeNumber
+
+
+def confirm_employee_selection(matches, requested_name, chooser=None):
+    """Handle employee selection when matches are found (see _resolve_employee)"""
+    return _resolve_employee(matches, requested_name, chooser)
 
 
 # Example usage (for testing)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The project is a flat collection of scripts, not an installed package;
+# make the repo root importable so tests can import the modules directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
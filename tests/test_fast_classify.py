@@ -0,0 +1,83 @@
+"""Tests for the regex fast path in prompts._fast_classify
+
+The fast path must agree with the SYSTEM_PROMPT contract on the requests
+it handles, and return None (defer to the LLM) on anything ambiguous.
+"""
+
+from prompts import _fast_classify
+
+_ZERO_TOKENS = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+
+def test_payslip_self_matches_system_prompt_example():
+    # The worked example from SYSTEM_PROMPT
+    result = _fast_classify("Provide my paystub for March 2022")
+    assert result == {
+        "intent": "PAYSLIP_SELF",
+        "parameters": {"fromDate": "2022-03-01", "toDate": "2022-03-31"},
+        "missing": [],
+        "token_info": _ZERO_TOKENS,
+    }
+
+
+def test_payslip_self_injects_current_user_employee_number():
+    result = _fast_classify("Provide my paystub for March 2022", "102938")
+    assert result["parameters"]["employeeNumber"] == "102938"
+
+
+def test_t4_self():
+    result = _fast_classify("Get my T4 for 2023")
+    assert result["intent"] == "T4_SELF"
+    assert result["parameters"] == {"year": 2023}
+    assert result["missing"] == []
+
+
+def test_t4a_on_behalf():
+    result = _fast_classify("Generate a T4A for employee 445566 for 2022")
+    assert result["intent"] == "T4A_ON_BEHALF"
+    assert result["parameters"] == {"year": 2022, "employeeNumber": "445566"}
+
+
+def test_employee_number_is_not_mistaken_for_year():
+    # "2023" here is the employee number, not a year; the LLM path would
+    # report year as missing, so the fast path must defer
+    assert _fast_classify("Get T4 for employee 2023") is None
+
+
+def test_year_like_employee_number_with_separate_year():
+    result = _fast_classify("Get T4 for employee 2023 for 2022")
+    assert result["intent"] == "T4_ON_BEHALF"
+    assert result["parameters"] == {"year": 2022, "employeeNumber": "2023"}
+
+
+def test_name_based_request_defers_to_llm():
+    assert _fast_classify("Get the 2022 T4 for Alex Martin") is None
+
+
+def test_self_pronoun_with_named_person_defers_to_llm():
+    # "my" refers to the relationship, not the document's subject
+    assert _fast_classify("a paystub for my colleague Alex Martin for January 2022") is None
+
+
+def test_self_pronoun_with_possessive_defers_to_llm():
+    assert _fast_classify("get my manager's T4 for 2023") is None
+
+
+def test_self_pronoun_with_other_name_possessive_defers_to_llm():
+    assert _fast_classify("send me Alex Martin's payslip for March 2022") is None
+
+
+def test_relationship_word_defers_to_llm():
+    assert _fast_classify("my coworker needs a T4 for 2023") is None
+
+
+def test_missing_year_defers_to_llm():
+    assert _fast_classify("Get my T4") is None
+
+
+def test_month_range_defers_to_llm():
+    assert _fast_classify("my payslips from January to March 2023") is None
+
+
+def test_non_document_request_defers_to_llm():
+    assert _fast_classify("What is my vacation balance for 2023?") is None